@@ -1,5 +1,6 @@
 from __future__ import annotations
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
@@ -8,6 +9,14 @@ import sys
 import math
 import itertools
 
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the vectorized NumPy path is used instead.
+    njit = None
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
@@ -21,13 +30,13 @@ ZONE_FORMAT_VERSION = "1.1.0"
 # Data Structures
 # ---------------------------------------------------------------------------
 
-@dataclass
+@dataclass(slots=True)
 class ZoneBrush:
     mins: Tuple[float, float, float]
     maxs: Tuple[float, float, float]
 
 
-@dataclass
+@dataclass(slots=True)
 class Zone:
     name: str
     zone_id: int
@@ -41,6 +50,11 @@ class Zone:
 # ---------------------------------------------------------------------------
 # Map utilities
 # ---------------------------------------------------------------------------
+#
+# All brush math is deliberately float64 with strict IEEE semantics (no
+# fastmath): .nsz coordinates are written as the str() of these values and the
+# output-matching test compares files by checksum, so the numerics must stay
+# bit-exact across machines and code paths.
 
 def load_map_without_geo(path: Path):
     """Load a .map file but do not parse brush geometry."""
@@ -49,125 +63,273 @@ def load_map_without_geo(path: Path):
     return parser.map_data
 
 
-def _vec_sub(a, b):
-    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
-
-def _vec_add(a, b):
-    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
-
-def _vec_dot(a, b):
-    return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
-
-def _vec_cross(a, b):
-    return (
-        a[1]*b[2] - a[2]*b[1],
-        a[2]*b[0] - a[0]*b[2],
-        a[0]*b[1] - a[1]*b[0],
-    )
-
-def _vec_scale(v, s):
-    return (v[0]*s, v[1]*s, v[2]*s)
-
-def _vec_len(v):
-    return math.sqrt(_vec_dot(v, v))
-
-def _vec_norm(v):
-    l = _vec_len(v)
-    if l == 0.0:
-        return (0.0, 0.0, 0.0)
-    return (v[0]/l, v[1]/l, v[2]/l)
-
-def _plane_from_face(face):
-    # p1, p2, p3 are any 3 points on the plane
-    p1 = (face.plane_points.v0.x, face.plane_points.v0.y, face.plane_points.v0.z)
-    p2 = (face.plane_points.v1.x, face.plane_points.v1.y, face.plane_points.v1.z)
-    p3 = (face.plane_points.v2.x, face.plane_points.v2.y, face.plane_points.v2.z)
+def _planes_array(brush):
+    """
+    Build the (P, 4) float64 plane array (nx, ny, nz, d) for a brush in one
+    batch, skipping degenerate faces. Every downstream kernel consumes this
+    one layout.
+    """
+    faces = brush.faces
+    pts = np.empty((len(faces), 3, 3), dtype=np.float64)
+    for i, face in enumerate(faces):
+        # Hoist the attribute chain once per face; repeated .plane_points.vN
+        # lookups dominate this loop otherwise.
+        pp = face.plane_points
+        v0, v1, v2 = pp.v0, pp.v1, pp.v2
+        pts[i, 0] = (v0.x, v0.y, v0.z)
+        pts[i, 1] = (v1.x, v1.y, v1.z)
+        pts[i, 2] = (v2.x, v2.y, v2.z)
+
+    p1, p2, p3 = pts[:, 0], pts[:, 1], pts[:, 2]
 
     # normal = normalize((p3 - p1) x (p2 - p1))  (matches your format description)
-    n = _vec_cross(_vec_sub(p3, p1), _vec_sub(p2, p1))
-    n = _vec_norm(n)
+    n = np.cross(p3 - p1, p2 - p1)
+    l = np.sqrt(n[:, 0]*n[:, 0] + n[:, 1]*n[:, 1] + n[:, 2]*n[:, 2])
 
-    # Plane equation: n·x = d
-    d = _vec_dot(n, p1)
+    # Drop degenerate faces; skip the fancy-index copies in the common case
+    # where every face is valid.
+    ok = l != 0.0
+    if not ok.all():
+        n, l, p1 = n[ok], l[ok], p1[ok]
+    n = n / l[:, None]
 
+    # Plane equation: n·x = d
     # Half-space rule from your docs:
     # points p where (p - p1)·n <= 0 are inside
     # => n·p <= n·p1 == d is inside
-    return n, d
+    planes = np.empty((n.shape[0], 4), dtype=np.float64)
+    planes[:, :3] = n
+    planes[:, 3] = n[:, 0]*p1[:, 0] + n[:, 1]*p1[:, 1] + n[:, 2]*p1[:, 2]
+    return planes
 
-def _intersect_3_planes(p1, p2, p3, eps=1e-9):
-    # Planes: n·x = d
-    (n1, d1) = p1
-    (n2, d2) = p2
-    (n3, d3) = p3
+_plane_triples_cache: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
 
-    n2xn3 = _vec_cross(n2, n3)
-    denom = _vec_dot(n1, n2xn3)
+def _plane_triples(P):
+    """
+    Index arrays (I, J, K) for every i < j < k triple of P planes, in the same
+    lexicographic order the old nested loops used. Brushes overwhelmingly share
+    a handful of face counts, so the arrays are cached per P.
+    """
+    triples = _plane_triples_cache.get(P)
+    if triples is None:
+        count = P * (P - 1) * (P - 2) // 6
+        idx = np.fromiter(
+            itertools.chain.from_iterable(itertools.combinations(range(P), 3)),
+            dtype=np.intp,
+            count=3 * count,
+        ).reshape(count, 3)
+        triples = (idx[:, 0].copy(), idx[:, 1].copy(), idx[:, 2].copy())
+        _plane_triples_cache[P] = triples
+    return triples
+
+def _candidate_brush_vertices(planes, epsilon, eps=1e-9):
+    """
+    Intersect every triple of brush planes in one vectorized batch and return
+    an (N, 3) array of the candidate points that lie inside the brush.
+    `planes` is the (P, 4) array from _planes_array. Duplicate points are NOT
+    removed.
+    """
+    P = planes.shape[0]
+    if P < 3:
+        return np.empty((0, 3), dtype=np.float64)
 
-    if abs(denom) < eps:
-        return None  # parallel / no single point intersection
+    N = planes[:, :3]
+    D = planes[:, 3]
 
-    term1 = _vec_scale(n2xn3, d1)
-    term2 = _vec_scale(_vec_cross(n3, n1), d2)
-    term3 = _vec_scale(_vec_cross(n1, n2), d3)
+    # All i < j < k plane triples as index arrays
+    I, J, K = _plane_triples(P)
 
-    x = _vec_scale(_vec_add(_vec_add(term1, term2), term3), 1.0 / denom)
-    return x
+    # denom = n_i · (n_j x n_k); near-zero means parallel / no single point
+    c_jk = np.cross(N[J], N[K])
+    denom = N[I, 0]*c_jk[:, 0] + N[I, 1]*c_jk[:, 1] + N[I, 2]*c_jk[:, 2]
+    valid = np.abs(denom) >= eps
 
-def get_vertices_for_brush(brush, epsilon=0.05):
+    I, J, K = I[valid], J[valid], K[valid]
+    c_jk = c_jk[valid]
+    denom = denom[valid]
+
+    # Scalar-triple-product formula for the intersection point of 3 planes
+    pts = (
+        c_jk * D[I, None]
+        + np.cross(N[K], N[I]) * D[J, None]
+        + np.cross(N[I], N[J]) * D[K, None]
+    ) * (1.0 / denom)[:, None]
+
+    # Inside test: n·p <= d + epsilon for all planes, as one matmul
+    inside = ((pts @ N.T) <= D + epsilon).all(axis=1)
+    return pts[inside]
+
+def _brush_aabb_kernel(planes, epsilon, eps):
     """
-    Return a list of world-space vertices for a convex Quake brush by intersecting planes.
-    epsilon is in Quake units.
+    JIT-compiled AABB kernel: intersect every i<j<k triple of the (P, 4)
+    plane array (nx, ny, nz, d) and track running min/max of the points that
+    pass the inside test, with no intermediate allocations. Returns
+    (minx, miny, minz, maxx, maxy, maxz); mins stay +inf when no point is found.
     """
-    planes = []
-    for face in brush.faces:
-        n, d = _plane_from_face(face)
-        # Skip degenerate faces
-        if _vec_len(n) == 0.0:
-            continue
-        planes.append((n, d))
+    P = planes.shape[0]
+    minx = miny = minz = np.inf
+    maxx = maxy = maxz = -np.inf
+    for j in range(P):
+        n2x, n2y, n2z, d2 = planes[j, 0], planes[j, 1], planes[j, 2], planes[j, 3]
+        for k in range(j + 1, P):
+            n3x, n3y, n3z, d3 = planes[k, 0], planes[k, 1], planes[k, 2], planes[k, 3]
+
+            # n2 x n3 is shared by every triple containing this (j, k) pair.
+            cx = n2y*n3z - n2z*n3y
+            cy = n2z*n3x - n2x*n3z
+            cz = n2x*n3y - n2y*n3x
+
+            # If the pair is near-parallel, |n1 · (n2 x n3)| <= |n2 x n3| < eps
+            # for every unit n1, so no triple with this pair can intersect.
+            if cx*cx + cy*cy + cz*cz < eps*eps:
+                continue
 
-    verts = []
-    for i in range(len(planes)):
-        for j in range(i + 1, len(planes)):
-            for k in range(j + 1, len(planes)):
-                p = _intersect_3_planes(planes[i], planes[j], planes[k])
-                if p is None:
-                    continue
+            for i in range(j):
+                n1x, n1y, n1z, d1 = planes[i, 0], planes[i, 1], planes[i, 2], planes[i, 3]
+
+                # denom = n1 · (n2 x n3)
+                denom = n1x*cx + n1y*cy + n1z*cz
+                if abs(denom) < eps:
+                    continue  # parallel / no single point intersection
+
+                # n3 x n1 and n1 x n2
+                t2x = n3y*n1z - n3z*n1y
+                t2y = n3z*n1x - n3x*n1z
+                t2z = n3x*n1y - n3y*n1x
+                t3x = n1y*n2z - n1z*n2y
+                t3y = n1z*n2x - n1x*n2z
+                t3z = n1x*n2y - n1y*n2x
+
+                inv = 1.0 / denom
+                px = (cx*d1 + t2x*d2 + t3x*d3) * inv
+                py = (cy*d1 + t2y*d2 + t3y*d3) * inv
+                pz = (cz*d1 + t2z*d2 + t3z*d3) * inv
 
                 # Inside test: n·p <= d + epsilon for all planes
                 inside = True
-                for (n, d) in planes:
-                    if _vec_dot(n, p) > d + epsilon:
+                for m in range(P):
+                    if planes[m, 0]*px + planes[m, 1]*py + planes[m, 2]*pz > planes[m, 3] + epsilon:
                         inside = False
                         break
                 if not inside:
                     continue
 
-                # Dedupe near-identical points
-                dup = False
-                for q in verts:
-                    if (abs(p[0] - q[0]) <= epsilon and
-                        abs(p[1] - q[1]) <= epsilon and
-                        abs(p[2] - q[2]) <= epsilon):
-                        dup = True
-                        break
-                if not dup:
-                    verts.append(p)
+                if px < minx: minx = px
+                if py < miny: miny = py
+                if pz < minz: minz = pz
+                if px > maxx: maxx = px
+                if py > maxy: maxy = py
+                if pz > maxz: maxz = pz
+
+    return minx, miny, minz, maxx, maxy, maxz
+
+if njit is not None:
+    # nogil lets the thread pool in process_map run brush kernels in parallel.
+    _brush_aabb_kernel = njit(cache=True, nogil=True)(_brush_aabb_kernel)
+
+def _axis_aligned_aabb(planes, epsilon):
+    """
+    Fast path for plain boxes: when all 6 faces are exactly axis-aligned, each
+    plane offset already is the box extent on its axis, so the AABB needs no
+    triple intersections at all. Returns None when the brush is not such a box
+    (the general kernels handle it instead).
+    """
+    mins = [0.0, 0.0, 0.0]
+    maxs = [0.0, 0.0, 0.0]
+    seen = 0  # bitmask: bits 0-2 = +x/+y/+z face seen, bits 3-5 = -x/-y/-z
+    for m in range(6):
+        nx, ny, nz, d = planes[m, 0], planes[m, 1], planes[m, 2], planes[m, 3]
+        if ny == 0.0 and nz == 0.0 and (nx == 1.0 or nx == -1.0):
+            axis, sign = 0, nx
+        elif nx == 0.0 and nz == 0.0 and (ny == 1.0 or ny == -1.0):
+            axis, sign = 1, ny
+        elif nx == 0.0 and ny == 0.0 and (nz == 1.0 or nz == -1.0):
+            axis, sign = 2, nz
+        else:
+            return None
+        bit = 1 << axis if sign > 0.0 else 1 << (axis + 3)
+        if seen & bit:
+            return None
+        seen |= bit
+        if d == 0.0:
+            # Canonicalize the zero sign so a face on an axis plane emits the
+            # same -0.0 min the intersection kernels produce.
+            d = 0.0
+        if sign > 0.0:
+            maxs[axis] = float(d)
+        else:
+            mins[axis] = float(-d)
+    if seen != 0b111111:
+        return None
+
+    # Mirror the general inside test: an inverted box yields no vertices there.
+    for axis in range(3):
+        if mins[axis] > maxs[axis] + epsilon:
+            return None
+    return (mins[0], mins[1], mins[2]), (maxs[0], maxs[1], maxs[2])
+
+def get_vertices_for_brush(brush, epsilon=0.05):
+    """
+    Return a list of world-space vertices for a convex Quake brush by intersecting planes.
+    epsilon is in Quake units.
+    """
+    candidates = _candidate_brush_vertices(_planes_array(brush), epsilon)
+
+    verts = []
+    for row in candidates:
+        p = (float(row[0]), float(row[1]), float(row[2]))
+
+        # Dedupe near-identical points
+        dup = False
+        for q in verts:
+            if (abs(p[0] - q[0]) <= epsilon and
+                abs(p[1] - q[1]) <= epsilon and
+                abs(p[2] - q[2]) <= epsilon):
+                dup = True
+                break
+        if not dup:
+            verts.append(p)
 
     return verts
 
+_aabb_cache: Dict[Tuple[bytes, float], Tuple] = {}
+
 def get_aabb_for_brush(brush, epsilon=0.05):
-    verts = get_vertices_for_brush(brush, epsilon=epsilon)
-    if not verts:
+    # Zone layouts frequently reuse identical brush shapes; the plane array
+    # fully determines the AABB, so memoize on its bytes.
+    planes = _planes_array(brush)
+    key = (planes.tobytes(), epsilon)
+    aabb = _aabb_cache.get(key)
+    if aabb is None:
+        aabb = _aabb_for_planes(planes, epsilon)
+        _aabb_cache[key] = aabb
+    return aabb
+
+def _aabb_for_planes(planes, epsilon):
+    if planes.shape[0] == 6:
+        aabb = _axis_aligned_aabb(planes, epsilon)
+        if aabb is not None:
+            return aabb
+
+    if njit is not None and planes.shape[0] >= 3:
+        minx, miny, minz, maxx, maxy, maxz = _brush_aabb_kernel(planes, epsilon, 1e-9)
+        if not math.isfinite(minx):
+            return None, None
+        return (minx, miny, minz), (maxx, maxy, maxz)
+
+    # Min/max is invariant to duplicate points, so skip get_vertices_for_brush
+    # and its dedupe pass and reduce the raw candidates directly.
+    candidates = _candidate_brush_vertices(planes, epsilon)
+    if candidates.shape[0] == 0:
         return None, None
 
-    xs = [v[0] for v in verts]
-    ys = [v[1] for v in verts]
-    zs = [v[2] for v in verts]
-
-    mins = (min(xs), min(ys), min(zs))
-    maxs = (max(xs), max(ys), max(zs))
+    # Take the first candidate attaining each extreme, like min()/max() over a
+    # list would, so the sign of zero in the output stays stable.
+    axes = np.arange(3)
+    lo = candidates[(candidates == candidates.min(axis=0)).argmax(axis=0), axes]
+    hi = candidates[(candidates == candidates.max(axis=0)).argmax(axis=0), axes]
+    mins = (float(lo[0]), float(lo[1]), float(lo[2]))
+    maxs = (float(hi[0]), float(hi[1]), float(hi[2]))
     return mins, maxs
 
 
@@ -177,105 +339,126 @@ def get_aabb_for_brush(brush, epsilon=0.05):
 
 def write_zones_to_file(zones: List[Zone], output_path: Path):
     """Write all zones to an .nsz file."""
-    with output_path.open("w") as f:
-        f.write(f"zone_file_version: {ZONE_FORMAT_VERSION}\n")
-        f.write(f"number_of_zones: {len(zones)}\n")
-
-        for zone in zones:
-            f.write(f"{zone.name}\n")
-            f.write(f"{zone.zone_id}\n")
-            f.write(f"{zone.target}\n")
-            f.write(f"{zone.fog}\n")
-
-            f.write(f"{len(zone.adjacent_zones)}\n")
-            for adj in zone.adjacent_zones:
-                f.write(f"{adj}\n")
-
-            f.write(f"{len(zone.brushes)}\n")
-            for b in zone.brushes:
-                f.write(f"{b.mins[0]} {b.mins[1]} {b.mins[2]}\n")
-                f.write(f"{b.maxs[0]} {b.maxs[1]} {b.maxs[2]}\n")
-
-            f.write(f"{len(zone.door_waypoint_targets)}\n")
-            for d in zone.door_waypoint_targets:
-                f.write(f"{d}\n")
+    # Build every line up front and flush with a single join + write instead
+    # of one syscall-prone f.write per line.
+    lines = [
+        f"zone_file_version: {ZONE_FORMAT_VERSION}",
+        f"number_of_zones: {len(zones)}",
+    ]
+
+    for zone in zones:
+        # name/target may be None when the entity lacks the property; coerce
+        # like the old per-line f-strings did instead of crashing the join.
+        lines.append(f"{zone.name}")
+        lines.append(f"{zone.zone_id}")
+        lines.append(f"{zone.target}")
+        lines.append(zone.fog)
+
+        adjacent_zones = zone.adjacent_zones
+        lines.append(f"{len(adjacent_zones)}")
+        lines.extend(map(str, adjacent_zones))
+
+        brushes = zone.brushes
+        lines.append(f"{len(brushes)}")
+        for b in brushes:
+            # %s renders the same str() the f-string produced, minus the
+            # per-field format machinery; mins/maxs are already 3-tuples.
+            lines.append("%s %s %s" % b.mins)
+            lines.append("%s %s %s" % b.maxs)
+
+        door_waypoint_targets = zone.door_waypoint_targets
+        lines.append(f"{len(door_waypoint_targets)}")
+        lines.extend(door_waypoint_targets)
+
+    lines.append("")  # trailing newline
+
+    # Binary mode with a large buffer: one encode, one write, and no newline
+    # translation layer between us and the file.
+    with output_path.open("wb", buffering=1024 * 1024) as f:
+        f.write("\n".join(lines).encode("utf-8"))
 
 
 # ---------------------------------------------------------------------------
 # Main Processing Logic
 # ---------------------------------------------------------------------------
 
+def _get_id_for_zone(zone_name_to_id: Dict[str, int], name: str) -> int:
+    """Return the id for a zone name, assigning the next free id on first use."""
+    return zone_name_to_id.setdefault(name, len(zone_name_to_id) + 1)
+
+
 def process_map(map_data):
     zone_name_to_id: Dict[str, int] = {}
-    next_zone_id = 1
     zones: List[Zone] = []
 
-    def get_id_for_zone(name: str) -> int:
-        nonlocal next_zone_id
-        if name not in zone_name_to_id:
-            zone_name_to_id[name] = next_zone_id
-            next_zone_id += 1
-        return zone_name_to_id[name]
-
     print(f"Total entities: {len(map_data.entities)}\n")
 
-    for ent in map_data.entities:
-        if ent.properties.get("classname") != "spawn_zone":
-            continue
-
-        zone_name = ent.properties.get("zone_name")
-        zone_target = ent.properties.get("zone_target")
-        zone_fog = ent.properties.get("zone_fog", "")
-
-        print(f"+ Found a spawn_zone entity:")
-        print(f" - Name:         {zone_name}")
-        print(f" - Target:       {zone_target}")
-        print(f" - Fog:          [{zone_fog}]")
-
-        # Resolve adjacent zones
-        adjacents = ent.properties.get("adjacent_zones", "")
-        adjacent_zones = [
-            get_id_for_zone(z.strip())
-            for z in adjacents.split(",")
-            if z.strip()
-        ]
-
-        print(f" - Adjacent:     {adjacent_zones}")
-
-        # Resolve door waypoint targets
-        door_waypoints = ent.properties.get("door_way_targets", "")
-        door_waypoint_targets = [
-            z.strip() for z in door_waypoints.split(",") if z.strip()
-        ]
-
-        print(f" - Door Targets: {door_waypoint_targets}")
-
-        # Zone brushes
-        brushes = []
-        for i, brush in enumerate(ent.brushes):
-            mins, maxs = get_aabb_for_brush(brush)
-            if mins is None or maxs is None:
-                print(f"   * Brush {i}: (no points?)")
+    with ThreadPoolExecutor() as pool:
+        for ent in map_data.entities:
+            # One lookup of the properties dict per entity; everything below
+            # reads from the local.
+            props = ent.properties
+            if props.get("classname") != "spawn_zone":
                 continue
 
-            brushes.append(ZoneBrush(mins=mins, maxs=maxs))
-            print(f"   * Brush {i}: mins={mins}, maxs={maxs}")
-
-        zone_id = get_id_for_zone(zone_name)
+            zone_name = props.get("zone_name")
+            zone_target = props.get("zone_target")
+            zone_fog = props.get("zone_fog", "")
+
+            # Buffer the per-zone report and print it in one go after the brush
+            # loop, so the hot path is not interleaved with stdout flushes.
+            report = [
+                f"+ Found a spawn_zone entity:",
+                f" - Name:         {zone_name}",
+                f" - Target:       {zone_target}",
+                f" - Fog:          [{zone_fog}]",
+            ]
+
+            # Resolve adjacent zones
+            adjacents = props.get("adjacent_zones", "")
+            adjacent_zones = [
+                _get_id_for_zone(zone_name_to_id, z.strip())
+                for z in adjacents.split(",")
+                if z.strip()
+            ]
+
+            report.append(f" - Adjacent:     {adjacent_zones}")
+
+            # Resolve door waypoint targets
+            door_waypoints = props.get("door_way_targets", "")
+            door_waypoint_targets = [
+                z.strip() for z in door_waypoints.split(",") if z.strip()
+            ]
+
+            report.append(f" - Door Targets: {door_waypoint_targets}")
+
+            # Zone brushes: AABBs are independent per brush, so compute them in
+            # parallel; pool.map preserves brush order.
+            brushes = []
+            for i, (mins, maxs) in enumerate(pool.map(get_aabb_for_brush, ent.brushes)):
+                if mins is None or maxs is None:
+                    report.append(f"   * Brush {i}: (no points?)")
+                    continue
 
-        zones.append(
-            Zone(
-                name=zone_name,
-                zone_id=zone_id,
-                target=zone_target,
-                fog=zone_fog,
-                adjacent_zones=adjacent_zones,
-                door_waypoint_targets=door_waypoint_targets,
-                brushes=brushes,
+                brushes.append(ZoneBrush(mins=mins, maxs=maxs))
+                report.append(f"   * Brush {i}: mins={mins}, maxs={maxs}")
+
+            zone_id = _get_id_for_zone(zone_name_to_id, zone_name)
+
+            zones.append(
+                Zone(
+                    name=zone_name,
+                    zone_id=zone_id,
+                    target=zone_target,
+                    fog=zone_fog,
+                    adjacent_zones=adjacent_zones,
+                    door_waypoint_targets=door_waypoint_targets,
+                    brushes=brushes,
+                )
             )
-        )
 
-        print()
+            report.append("")
+            print("\n".join(report))
 
     return zones
 